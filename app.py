@@ -1,15 +1,22 @@
 import os
-import zipfile
+import glob
+import sqlite3
+import threading
+import time
+import uuid
 import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
 import librosa
 import cv2
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from flask import Flask, request, render_template, jsonify, send_file, url_for
+import soundfile as sf
+import scipy.fft
+import scipy.signal
+from numba import njit
+from flask import Flask, Response, request, render_template, jsonify, send_from_directory, g
 from werkzeug.utils import secure_filename
-from pydub import AudioSegment
+from zipstream import ZipStream, ZIP_STORED
 import tempfile
 import shutil
 from datetime import datetime
@@ -18,98 +25,213 @@ from io import BytesIO
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['SPECTROGRAM_FOLDER'] = 'temp_spectrograms'
-app.config['OUTPUT_FOLDER'] = 'output'
+# Resolve paths against the app root so file helpers and send_from_directory agree
+app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'uploads')
+app.config['SPECTROGRAM_FOLDER'] = os.path.join(app.root_path, 'temp_spectrograms')
+app.config['DATABASE'] = os.path.join(app.root_path, 'batch.db')
 
-# Ensure directories exist
-for folder in [app.config['UPLOAD_FOLDER'], app.config['SPECTROGRAM_FOLDER'], app.config['OUTPUT_FOLDER']]:
+# Ensure directories exist, and remove staging/trash folders left behind when
+# a previous process exited before finishing an upload or its cleanup
+for folder in [app.config['UPLOAD_FOLDER'], app.config['SPECTROGRAM_FOLDER']]:
     os.makedirs(folder, exist_ok=True)
-
-# Global variables to store processing data
-batch_data = {}
-spectrogram_cache = {}
+    for leftover in glob.glob(f"{glob.escape(folder)}.trash.*") + glob.glob(f"{glob.escape(folder)}.staging.*"):
+        shutil.rmtree(leftover, ignore_errors=True)
 
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'flac', 'aac'}
+SOUNDFILE_EXTENSIONS = ('.wav', '.flac')  # Formats libsndfile reads natively
+
+# Mel spectrogram parameters (shared by every file in a batch)
+SAMPLE_RATE = 22050
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+FMAX = 8000
+
+# Mel dB values span [-80, 0] (power_to_db's top_db) and are stored as uint8
+MEL_DB_MIN = -80.0
+MEL_DB_SCALE = 80.0 / 255
+AMIN = 1e-10  # Power floor before taking the log (as in librosa.power_to_db)
+
+# Columns louder than mean + k * std of the detection window form the noise band
+BAND_THRESHOLD_STD = 0.5
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def generate_mel_spectrogram(audio_path, output_path=None):
-    """Generate mel spectrogram from audio file"""
+def get_db():
+    """Get the SQLite connection holding batch metadata for this request"""
+    if 'db' not in g:
+        g.db = sqlite3.connect(app.config['DATABASE'])
+        g.db.row_factory = sqlite3.Row
+        g.db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                unique_filename TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                detected_start REAL,
+                detected_end REAL,
+                duration REAL,
+                sr INTEGER,
+                orig_sr INTEGER
+            )
+        """)
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exception):
+    """Close the SQLite connection at the end of the request"""
+    db = g.pop('db', None)
+    if db is not None:
+        db.close()
+
+def get_array_path(unique_filename, kind, folder=None):
+    """Path of a per-file array (mel or pcm) saved alongside the batch"""
+    return os.path.join(folder or app.config['SPECTROGRAM_FOLDER'], f"{unique_filename}.{kind}.npy")
+
+@lru_cache(maxsize=None)
+def get_mel_filterbank(sr, n_fft, n_mels, fmax):
+    """Build (and cache) the mel filter bank for the given parameters"""
+    return librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels, fmax=fmax)
+
+@lru_cache(maxsize=None)
+def get_mel_filter_bounds(sr, n_fft, n_mels, fmax):
+    """First and one-past-last non-zero FFT bin of each (triangular) mel filter"""
+    mel_fb = get_mel_filterbank(sr, n_fft, n_mels, fmax)
+    nonzero = mel_fb > 0
+    starts = np.where(nonzero.any(axis=1), nonzero.argmax(axis=1), 0)
+    stops = np.where(nonzero.any(axis=1), mel_fb.shape[1] - nonzero[:, ::-1].argmax(axis=1), 0)
+    return starts.astype(np.int64), stops.astype(np.int64)
+
+@lru_cache(maxsize=None)
+def get_stft_window(n_fft):
+    """Build (and cache) the periodic Hann window used for the STFT"""
+    return scipy.signal.get_window('hann', n_fft).astype(np.float32)
+
+def load_pcm(audio_path):
+    """Decode audio to int16 PCM (samples x channels) at its native sample rate"""
+    # Fast path: decode with libsndfile
+    if audio_path.lower().endswith(SOUNDFILE_EXTENSIONS):
+        try:
+            return sf.read(audio_path, dtype='int16', always_2d=True)
+        except RuntimeError:
+            pass
+    
+    # Fall back to librosa (audioread/FFmpeg) for compressed formats
+    y, orig_sr = librosa.load(audio_path, sr=None, mono=False)
+    pcm = np.clip(np.atleast_2d(y).T * 32768, -32768, 32767).astype(np.int16)
+    return pcm, orig_sr
+
+def pcm_to_mono(pcm, orig_sr, sr=SAMPLE_RATE):
+    """Downmix int16 PCM to mono float32 and resample with a polyphase filter"""
+    y = pcm.mean(axis=1, dtype=np.float32) / 32768
+    if orig_sr != sr:
+        y = scipy.signal.resample_poly(y, sr, orig_sr).astype(np.float32)
+    return y
+
+def compute_stft(y, window, hop_length, workers=-1):
+    """Compute the complex STFT (frames x bins) with multi-threaded FFTs
+    
+    Pass workers=1 from inside a process pool to avoid oversubscribing cores.
+    """
+    # Center frames the same way librosa.stft does (zero padding)
+    n_fft = len(window)
+    y = np.pad(y, n_fft // 2)
+    
+    frames = np.lib.stride_tricks.sliding_window_view(y, n_fft)[::hop_length] * window
+    return scipy.fft.rfft(frames, axis=1, workers=workers)
+
+@njit(fastmath=True, cache=True)
+def mel_db_and_energy(spec_re, spec_im, mel_fb, fb_start, fb_stop):
+    """Fused power -> mel -> dB pass over STFT frames
+    
+    Returns the mel spectrogram in (unreferenced) dB and the mean dB of each
+    frame, touching only the non-zero bins of every mel filter.
+    """
+    n_frames = spec_re.shape[0]
+    n_mels = mel_fb.shape[0]
+    mel_db = np.empty((n_mels, n_frames), dtype=np.float32)
+    col_energy = np.empty(n_frames, dtype=np.float32)
+    
+    for t in range(n_frames):
+        total = 0.0
+        for m in range(n_mels):
+            acc = 0.0
+            for k in range(fb_start[m], fb_stop[m]):
+                acc += mel_fb[m, k] * (spec_re[t, k] * spec_re[t, k] + spec_im[t, k] * spec_im[t, k])
+            db = 10.0 * np.log10(max(acc, AMIN))
+            mel_db[m, t] = db
+            total += db
+        col_energy[t] = total / n_mels
+    
+    return mel_db, col_energy
+
+def quantize_mel_db(mel_spec_db):
+    """Quantize mel dB values to uint8 (dB = q * MEL_DB_SCALE + MEL_DB_MIN)"""
+    q = np.round((mel_spec_db - MEL_DB_MIN) / MEL_DB_SCALE)
+    return np.clip(q, 0, 255).astype(np.uint8)
+
+def generate_mel_spectrogram(audio_path, pcm_path):
+    """Generate the quantized mel spectrogram and per-frame energy of a file
+    
+    Kept at module level so it can be dispatched to worker processes; only the
+    compact uint8 spectrogram travels back to the request process.
+    """
     try:
-        # Load audio file
-        y, sr = librosa.load(audio_path, sr=22050)
+        pcm, orig_sr = load_pcm(audio_path)
         
-        # Generate mel spectrogram
-        mel_spec = librosa.feature.melspectrogram(
-            y=y, sr=sr, n_mels=128, fmax=8000, hop_length=512, n_fft=2048
-        )
-        mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+        # Keep decoded PCM for cropping only when re-decoding would need FFmpeg;
+        # libsndfile re-reads WAV/FLAC about as fast as loading a saved copy
+        if not audio_path.lower().endswith(SOUNDFILE_EXTENSIONS):
+            np.save(pcm_path, pcm)
         
-        # Create time axis
-        time_frames = librosa.frames_to_time(np.arange(mel_spec.shape[1]), sr=sr, hop_length=512)
+        y = pcm_to_mono(pcm, orig_sr)
         
-        # Save as PNG if output path provided
-        if output_path:
-            plt.figure(figsize=(12, 8))
-            librosa.display.specshow(
-                mel_spec_db, sr=sr, x_axis='time', y_axis='mel', 
-                fmax=8000, cmap='viridis'
-            )
-            plt.colorbar(format='%+2.0f dB')
-            plt.title('Mel Spectrogram')
-            plt.tight_layout()
-            plt.savefig(output_path, dpi=150, bbox_inches='tight', 
-                       facecolor='black', edgecolor='black')
-            plt.close()
+        # Already running one file per core in the pool, so keep the FFT single-threaded
+        spec = compute_stft(y, get_stft_window(N_FFT), HOP_LENGTH, workers=1)
         
-        return mel_spec_db, time_frames, sr
+        mel_fb = get_mel_filterbank(SAMPLE_RATE, N_FFT, N_MELS, FMAX)
+        fb_start, fb_stop = get_mel_filter_bounds(SAMPLE_RATE, N_FFT, N_MELS, FMAX)
+        mel_db, col_energy = mel_db_and_energy(spec.real, spec.imag, mel_fb, fb_start, fb_stop)
+        
+        # Reference to the file's own peak (ref=np.max); quantizing clips at -80 dB
+        mel_spec_db = quantize_mel_db(mel_db - mel_db.max())
+        return mel_spec_db, col_energy, orig_sr
         
     except Exception as e:
         print(f"Error generating spectrogram for {audio_path}: {str(e)}")
         return None, None, None
 
-def detect_switch_noise(mel_spec_db, time_frames, start_time=5.0, end_time=7.0):
-    """Detect switch noise in spectrogram using OpenCV"""
+def detect_switch_noise(col_energy, sr, hop_length=HOP_LENGTH, start_time=5.0, end_time=7.0):
+    """Detect switch noise from the spectrogram's per-frame energy"""
     try:
-        # Focus on the 5-7 second interval
-        start_idx = np.argmin(np.abs(time_frames - start_time))
-        end_idx = np.argmin(np.abs(time_frames - end_time))
+        # Focus on the 5-7 second interval (frames are uniformly spaced)
+        frames_per_sec = sr / hop_length
+        n_frames = len(col_energy)
+        start_idx = min(max(int(round(start_time * frames_per_sec)), 0), n_frames)
+        end_idx = min(max(int(round(end_time * frames_per_sec)), 0), n_frames)
         
         if start_idx >= end_idx:
             return None, None
         
-        # Extract region of interest
-        roi = mel_spec_db[:, start_idx:end_idx]
-        
-        # Normalize to 0-255 range
-        roi_normalized = cv2.normalize(roi, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        # Switch noise appears as a vertical band, i.e. a peak in column energy
+        energy = cv2.boxFilter(col_energy[start_idx:end_idx].reshape(1, -1), -1, (5, 1)).ravel()
+        center = int(np.argmax(energy))
         
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(roi_normalized, (5, 5), 0)
-        
-        # Apply threshold to highlight high-energy regions
-        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Find vertical structures (switch noise appears as vertical bands)
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 10))
-        vertical_structure = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-        
-        # Find contours
-        contours, _ = cv2.findContours(vertical_structure, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        if not contours:
+        # Keep the contiguous run of high-energy columns around the peak
+        above = energy > energy.mean() + BAND_THRESHOLD_STD * energy.std()
+        if not above[center]:
             return start_time, end_time
         
-        # Find the largest contour (most likely switch noise)
-        largest_contour = max(contours, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(largest_contour)
+        below = np.flatnonzero(~above)
+        left = below[below < center]
+        right = below[below > center]
+        x = left[-1] + 1 if len(left) else 0
+        w = (right[0] if len(right) else len(energy)) - x
         
         # Convert back to time domain
-        detected_start = time_frames[start_idx + x]
-        detected_end = time_frames[start_idx + x + w]
+        detected_start = (start_idx + x) / frames_per_sec
+        detected_end = (start_idx + x + w) / frames_per_sec
         
         # Ensure reasonable bounds
         detected_start = max(4.5, min(detected_start, 6.0))
@@ -138,48 +260,43 @@ def calculate_weighted_average_interval(intervals):
     
     return round(avg_start, 2), round(avg_end, 2)
 
-def crop_and_split_audio(audio_path, start_time, end_time, output_dir, filename):
-    """Crop audio to remove switch noise and split into two halves"""
+def encode_wav(chunks, sr):
+    """Encode consecutive int16 PCM chunks as one in-memory 16-bit WAV file"""
+    buffer = BytesIO()
+    with sf.SoundFile(buffer, 'w', samplerate=sr, channels=chunks[0].shape[1],
+                      format='WAV', subtype='PCM_16') as wav:
+        for chunk in chunks:
+            wav.write(chunk)
+    return buffer.getvalue()
+
+def crop_and_split_audio(audio_path, start_time, end_time, pcm=None, sr=None):
+    """Crop audio to remove switch noise and split into two WAV-encoded halves"""
     try:
-        # Load audio
-        if audio_path.endswith('.mp3'):
-            audio = AudioSegment.from_mp3(audio_path)
-        else:
-            audio = AudioSegment.from_wav(audio_path)
-        
-        # Convert times to milliseconds
-        start_ms = int(start_time * 1000)
-        end_ms = int(end_time * 1000)
-        
-        # Create cropped version (remove switch noise)
-        before_switch = audio[:start_ms]
-        after_switch = audio[end_ms:]
-        cropped_audio = before_switch + after_switch
-        
-        # Split into two equal halves
-        mid_point = len(cropped_audio) // 2
-        clockwise = cropped_audio[:mid_point]
-        anticlockwise = cropped_audio[mid_point:]
+        # Reuse PCM decoded at upload time, otherwise decode from disk
+        if pcm is None:
+            pcm, sr = load_pcm(audio_path)
         
-        # Create output directories
-        cw_dir = os.path.join(output_dir, 'Clockwise')
-        acw_dir = os.path.join(output_dir, 'Anticlockwise')
-        os.makedirs(cw_dir, exist_ok=True)
-        os.makedirs(acw_dir, exist_ok=True)
+        # Create cropped version (remove switch noise) as two views, without copying
+        start_idx = int(start_time * sr)
+        end_idx = int(end_time * sr)
+        before_switch = pcm[:start_idx]
+        after_switch = pcm[end_idx:]
         
-        # Save files
-        base_name = os.path.splitext(filename)[0]
-        cw_path = os.path.join(cw_dir, f"{base_name}_cw.wav")
-        acw_path = os.path.join(acw_dir, f"{base_name}_acw.wav")
-        
-        clockwise.export(cw_path, format="wav")
-        anticlockwise.export(acw_path, format="wav")
+        # Split into two equal halves; only the half spanning the cut has two chunks
+        mid_point = (len(before_switch) + len(after_switch)) // 2
+        if mid_point <= len(before_switch):
+            clockwise = [before_switch[:mid_point]]
+            anticlockwise = [before_switch[mid_point:], after_switch]
+        else:
+            split_idx = mid_point - len(before_switch)
+            clockwise = [before_switch, after_switch[:split_idx]]
+            anticlockwise = [after_switch[split_idx:]]
         
-        return True
+        return encode_wav(clockwise, sr), encode_wav(anticlockwise, sr)
         
     except Exception as e:
         print(f"Error processing {audio_path}: {str(e)}")
-        return False
+        return None, None
 
 @app.route('/')
 def index():
@@ -189,8 +306,6 @@ def index():
 @app.route('/upload', methods=['POST'])
 def upload_files():
     """Handle file uploads and initial processing"""
-    global batch_data, spectrogram_cache
-    
     if 'files' not in request.files:
         return jsonify({'error': 'No files provided'}), 400
     
@@ -198,64 +313,98 @@ def upload_files():
     if not files or all(file.filename == '' for file in files):
         return jsonify({'error': 'No files selected'}), 400
     
-    # Clear previous data
-    batch_data = {}
-    spectrogram_cache = {}
-    
-    # Clean up old files
-    for folder in [app.config['UPLOAD_FOLDER'], app.config['SPECTROGRAM_FOLDER']]:
-        for file in os.listdir(folder):
-            os.remove(os.path.join(folder, file))
+    # Build the new batch in staging folders so the previous one stays
+    # usable until the new rows are committed
+    live_folders = [app.config['UPLOAD_FOLDER'], app.config['SPECTROGRAM_FOLDER']]
+    staging_folders = [f"{folder}.staging.{os.getpid()}.{time.time_ns()}" for folder in live_folders]
+    upload_staging, spectrogram_staging = staging_folders
+    for folder in staging_folders:
+        os.makedirs(folder)
     
+    rows = []
     results = []
     intervals = []
     
-    for file in files:
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
-            unique_filename = timestamp + filename
+    try:
+        saved_files = []
+        for file in files:
+            if file and allowed_file(file.filename):
+                filename = secure_filename(file.filename)
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_')
+                # The timestamp alone collides for same-named files in one batch
+                unique_filename = f"{timestamp}{uuid.uuid4().hex[:8]}_{filename}"
+                
+                # Save uploaded file
+                file.save(os.path.join(upload_staging, unique_filename))
+                saved_files.append((filename, unique_filename))
+        
+        # Analyze files in parallel; each one is independent and CPU-bound
+        analyses = []
+        if saved_files:
+            max_workers = min(os.cpu_count() or 1, len(saved_files))
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                analyses = list(executor.map(
+                    generate_mel_spectrogram,
+                    [os.path.join(upload_staging, unique_filename) for _, unique_filename in saved_files],
+                    [get_array_path(unique_filename, 'pcm', spectrogram_staging) for _, unique_filename in saved_files]
+                ))
+        
+        for (filename, unique_filename), analysis in zip(saved_files, analyses):
+            mel_spec_db, col_energy, orig_sr = analysis
+            if mel_spec_db is None:
+                continue
             
-            # Save uploaded file
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
+            sr = SAMPLE_RATE
             
-            # Generate spectrogram
-            spec_image_path = os.path.join(app.config['SPECTROGRAM_FOLDER'], f"{unique_filename}.png")
-            mel_spec_db, time_frames, sr = generate_mel_spectrogram(file_path, spec_image_path)
+            # Detect switch noise
+            start_time, end_time = detect_switch_noise(col_energy, sr)
+            duration = mel_spec_db.shape[1] * HOP_LENGTH / sr
             
-            if mel_spec_db is not None:
-                # Detect switch noise
-                start_time, end_time = detect_switch_noise(mel_spec_db, time_frames)
-                
-                # Store data
-                file_data = {
-                    'filename': filename,
-                    'unique_filename': unique_filename,
-                    'file_path': file_path,
-                    'spec_image_path': spec_image_path,
-                    'detected_interval': (start_time, end_time),
-                    'duration': len(time_frames) * (time_frames[1] - time_frames[0]) if len(time_frames) > 1 else 12.0
-                }
-                
-                batch_data[unique_filename] = file_data
-                spectrogram_cache[unique_filename] = {
-                    'mel_spec_db': mel_spec_db.tolist(),
-                    'time_frames': time_frames.tolist(),
-                    'sr': sr
-                }
-                
-                intervals.append((start_time, end_time))
-                results.append({
-                    'filename': filename,
-                    'unique_filename': unique_filename,
-                    'detected_start': round(start_time, 2),
-                    'detected_end': round(end_time, 2),
-                    'duration': round(file_data['duration'], 2)
-                })
+            # Keep the quantized spectrogram on disk
+            np.save(get_array_path(unique_filename, 'mel', spectrogram_staging), mel_spec_db)
+            
+            # Rows point at the live folder the staging folder is swapped into
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+            rows.append((unique_filename, filename, file_path, start_time, end_time, duration, sr, orig_sr))
+            
+            intervals.append((start_time, end_time))
+            results.append({
+                'filename': filename,
+                'unique_filename': unique_filename,
+                'detected_start': round(start_time, 2),
+                'detected_end': round(end_time, 2),
+                'duration': round(duration, 2)
+            })
+        
+        if not results:
+            for folder in staging_folders:
+                shutil.rmtree(folder, ignore_errors=True)
+            return jsonify({'error': 'No valid audio files processed'}), 400
+        
+        # Replace the previous batch in one short transaction
+        db = get_db()
+        with db:
+            db.execute('DELETE FROM files')
+            db.executemany(
+                'INSERT INTO files (unique_filename, filename, file_path, detected_start, '
+                'detected_end, duration, sr, orig_sr) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+    except Exception:
+        for folder in staging_folders:
+            shutil.rmtree(folder, ignore_errors=True)
+        raise
     
-    if not results:
-        return jsonify({'error': 'No valid audio files processed'}), 400
+    # Swap the new batch in, delete the old one in the background
+    for folder, staging in zip(live_folders, staging_folders):
+        trash = f"{folder}.trash.{os.getpid()}.{time.time_ns()}"
+        try:
+            os.rename(folder, trash)
+        except FileNotFoundError:
+            pass
+        else:
+            threading.Thread(target=shutil.rmtree, args=(trash, True), daemon=True).start()
+        os.rename(staging, folder)
     
     # Calculate weighted average
     avg_start, avg_end = calculate_weighted_average_interval(intervals)
@@ -273,37 +422,60 @@ def upload_files():
 @app.route('/get_spectrogram/<unique_filename>')
 def get_spectrogram(unique_filename):
     """Get spectrogram data for visualization"""
-    if unique_filename not in spectrogram_cache:
+    file_info = get_db().execute(
+        'SELECT * FROM files WHERE unique_filename = ?', (unique_filename,)
+    ).fetchone()
+    if file_info is None:
         return jsonify({'error': 'Spectrogram not found'}), 404
     
-    spec_data = spectrogram_cache[unique_filename]
-    file_info = batch_data.get(unique_filename, {})
+    # Send uint8 bytes as base64; the client dequantizes with scale/offset
+    mel_spec_db = np.load(get_array_path(unique_filename, 'mel'), mmap_mode='r')
     
     return jsonify({
-        'mel_spec_db': spec_data['mel_spec_db'],
-        'time_frames': spec_data['time_frames'],
-        'sr': spec_data['sr'],
-        'filename': file_info.get('filename', ''),
-        'detected_interval': file_info.get('detected_interval', [5.5, 6.5])
+        'mel_spec_db': base64.b64encode(mel_spec_db.tobytes()).decode('ascii'),
+        'shape': list(mel_spec_db.shape),
+        'scale': MEL_DB_SCALE,
+        'offset': MEL_DB_MIN,
+        'sr': file_info['sr'],
+        'hop_length': HOP_LENGTH,
+        'filename': file_info['filename'],
+        'detected_interval': [file_info['detected_start'], file_info['detected_end']]
     })
 
+@app.route('/get_spectrogram_png/<unique_filename>')
+def get_spectrogram_png(unique_filename):
+    """Render a spectrogram PNG preview on demand"""
+    mel_path = get_array_path(unique_filename, 'mel')
+    if not os.path.exists(mel_path):
+        return jsonify({'error': 'Spectrogram not found'}), 404
+    
+    image_name = f"{unique_filename}.png"
+    image_path = os.path.join(app.config['SPECTROGRAM_FOLDER'], image_name)
+    if not os.path.exists(image_path):
+        mel_spec_db = np.load(mel_path)
+        normalized = cv2.normalize(mel_spec_db, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+        
+        # Flip vertically so low frequencies sit at the bottom
+        colored = cv2.applyColorMap(cv2.flip(normalized, 0), cv2.COLORMAP_VIRIDIS)
+        cv2.imwrite(image_path, colored)
+    
+    return send_from_directory(app.config['SPECTROGRAM_FOLDER'], image_name, mimetype='image/png')
+
 @app.route('/get_file_list')
 def get_file_list():
     """Get list of uploaded files"""
     files = []
-    for unique_filename, data in batch_data.items():
+    for data in get_db().execute('SELECT * FROM files ORDER BY rowid'):
         files.append({
-            'unique_filename': unique_filename,
+            'unique_filename': data['unique_filename'],
             'filename': data['filename'],
-            'detected_interval': data['detected_interval']
+            'detected_interval': [data['detected_start'], data['detected_end']]
         })
     return jsonify(files)
 
 @app.route('/process_batch', methods=['POST'])
 def process_batch():
     """Process entire batch with confirmed interval"""
-    global batch_data
-    
     data = request.get_json()
     if not data or 'start_time' not in data or 'end_time' not in data:
         return jsonify({'error': 'Invalid parameters'}), 400
@@ -311,58 +483,59 @@ def process_batch():
     start_time = float(data['start_time'])
     end_time = float(data['end_time'])
     
-    # Create output directory
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    output_dir = os.path.join(app.config['OUTPUT_FOLDER'], f'batch_{timestamp}')
-    os.makedirs(output_dir, exist_ok=True)
     
     processed_files = []
     failed_files = []
     
-    for unique_filename, file_data in batch_data.items():
-        success = crop_and_split_audio(
+    file_rows = get_db().execute('SELECT * FROM files ORDER BY rowid').fetchall()
+    
+    def crop_file(file_data):
+        # Memory-map the PCM saved at upload (compressed formats); otherwise decode the upload
+        pcm_path = get_array_path(file_data['unique_filename'], 'pcm')
+        pcm = np.load(pcm_path, mmap_mode='r') if os.path.exists(pcm_path) else None
+        
+        return crop_and_split_audio(
             file_data['file_path'],
             start_time,
             end_time,
-            output_dir,
-            file_data['filename']
+            pcm=pcm,
+            sr=file_data['orig_sr']
         )
-        
-        if success:
-            processed_files.append(file_data['filename'])
-        else:
-            failed_files.append(file_data['filename'])
     
-    # Create ZIP file
+    # Stream the ZIP straight to the client; WAV data barely compresses, so store it
     zip_filename = f'processed_audio_{timestamp}.zip'
-    zip_path = os.path.join(app.config['OUTPUT_FOLDER'], zip_filename)
-    
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(output_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, output_dir)
-                zipf.write(file_path, arcname)
+    zip_stream = ZipStream(compress_type=ZIP_STORED, sized=True)
+    name_counts = {}
     
-    # Clean up temporary directory
-    shutil.rmtree(output_dir)
-    
-    return jsonify({
-        'success': True,
-        'zip_filename': zip_filename,
-        'processed_files': len(processed_files),
-        'failed_files': len(failed_files),
-        'download_url': url_for('download_zip', filename=zip_filename)
-    })
-
-@app.route('/download/<filename>')
-def download_zip(filename):
-    """Download processed ZIP file"""
-    zip_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-    if not os.path.exists(zip_path):
-        return jsonify({'error': 'File not found'}), 404
+    # Crop files in parallel threads (numpy and libsndfile release the GIL)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for file_data, (cw_bytes, acw_bytes) in zip(file_rows, executor.map(crop_file, file_rows)):
+            if cw_bytes is not None:
+                base_name = os.path.splitext(file_data['filename'])[0]
+                
+                # Keep archive entries distinct when the batch has same-named files
+                name_counts[base_name] = name_counts.get(base_name, 0) + 1
+                if name_counts[base_name] > 1:
+                    base_name = f"{base_name}_{name_counts[base_name]}"
+                zip_stream.add(cw_bytes, f"Clockwise/{base_name}_cw.wav")
+                zip_stream.add(acw_bytes, f"Anticlockwise/{base_name}_acw.wav")
+                processed_files.append(file_data['filename'])
+            else:
+                failed_files.append(file_data['filename'])
     
-    return send_file(zip_path, as_attachment=True, download_name=filename)
+    return Response(
+        zip_stream,
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename={zip_filename}',
+            'Content-Length': str(len(zip_stream)),
+            # Let reverse proxies (nginx) pass the stream through without buffering it
+            'X-Accel-Buffering': 'no',
+            'X-Processed-Files': str(len(processed_files)),
+            'X-Failed-Files': str(len(failed_files))
+        }
+    )
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -207,12 +207,23 @@ class AudioCropperApp {
         }
     }
 
+    decodeSpectrogram(data) {
+        // Spectrogram arrives as base64-encoded uint8 values: dB = q * scale + offset
+        const bytes = Uint8Array.from(atob(data.mel_spec_db), c => c.charCodeAt(0));
+        const [nMels, nFrames] = data.shape;
+
+        return Array.from({length: nMels}, (_, i) =>
+            Array.from(bytes.subarray(i * nFrames, (i + 1) * nFrames), q => q * data.scale + data.offset)
+        );
+    }
+
     async renderSpectrogram(data) {
         const plotDiv = document.getElementById('spectrogram-plot');
         
         // Prepare data for plotting
-        const melSpecDb = data.mel_spec_db;
-        const timeFrames = data.time_frames;
+        const melSpecDb = this.decodeSpectrogram(data);
+        // Frames are uniformly spaced, so rebuild the time axis from the hop rate
+        const timeFrames = Array.from({length: data.shape[1]}, (_, k) => k * data.hop_length / data.sr);
         
         const plotData = [{
             z: melSpecDb,
@@ -397,17 +408,22 @@ class AudioCropperApp {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const result = await response.json();
-            
-            if (result.success) {
-                this.hideLoading('batch-loading');
-                document.getElementById('processing-results').style.display = 'block';
-                document.getElementById('processed-count').textContent = result.processed_files;
-                document.getElementById('download-link').href = result.download_url;
-                document.getElementById('download-link').download = result.zip_filename;
-            } else {
-                throw new Error(result.error || 'Processing failed');
+            // The ZIP is streamed back directly; counts travel in response headers
+            const disposition = response.headers.get('Content-Disposition') || '';
+            const match = disposition.match(/filename="?([^";]+)"?/);
+            const zipFilename = match ? match[1] : 'processed_audio.zip';
+            const blob = await response.blob();
+
+            if (this.downloadUrl) {
+                URL.revokeObjectURL(this.downloadUrl);
             }
+            this.downloadUrl = URL.createObjectURL(blob);
+
+            this.hideLoading('batch-loading');
+            document.getElementById('processing-results').style.display = 'block';
+            document.getElementById('processed-count').textContent = response.headers.get('X-Processed-Files');
+            document.getElementById('download-link').href = this.downloadUrl;
+            document.getElementById('download-link').download = zipFilename;
         } catch (error) {
             console.error('Processing error:', error);
             this.hideLoading('batch-loading');